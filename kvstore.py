@@ -1,5 +1,11 @@
 import sys
 import os
+import atexit
+import queue
+import struct
+import threading
+import time
+import zlib
 
 # ─────────────────────────────────────────────────────────────
 # Constants
@@ -9,8 +15,152 @@ CMD_SET = 'SET'
 CMD_GET = 'GET'
 CMD_EXIT = 'EXIT'
 
-# In-memory key-value store (O(1) lookups)
-store = {}
+# On-disk log format: LOG_MAGIC, then one record per SET laid out as
+# <u32 key_len><u32 value_len><u32 crc32(key + value)><key><value>
+# (little-endian). The checksum catches records torn by a crash, including
+# ones whose missing bytes read back as preallocated zeros.
+# Files without a 'KVB' magic are legacy text logs ('SET <key> <value>'
+# lines) and are rewritten in the binary format on first start.
+LOG_MAGIC = b'KVB2'
+_MAGIC_FAMILY = b'KVB'
+_REC_HEADER = struct.Struct('<III')
+_SET_PREFIX = CMD_SET.encode() + b' '  # Line prefix in legacy text logs
+
+# Durability policy for SETs (env SYNC_POLICY):
+#   ALWAYS    - every batch of SETs is fsynced as it is written (default,
+#               safest); see BATCH_SIZE / FLUSH_INTERVAL for batching
+#   EVERY_SEC - background thread fsyncs at most once per second (group commit)
+#   NONE      - never fsync explicitly; leave flushing to the OS
+SYNC_ALWAYS = 'ALWAYS'
+SYNC_EVERY_SEC = 'EVERY_SEC'
+SYNC_NONE = 'NONE'
+SYNC_POLICY = os.environ.get('SYNC_POLICY', SYNC_ALWAYS).upper()
+if SYNC_POLICY not in (SYNC_ALWAYS, SYNC_EVERY_SEC, SYNC_NONE):
+    # Never let a typo silently turn off durability
+    print(f"Warning: unknown SYNC_POLICY {SYNC_POLICY!r}, using "
+          f"{SYNC_ALWAYS}", file=sys.stderr)
+    SYNC_POLICY = SYNC_ALWAYS
+
+# Data-only sync where available: the log is append-only, so only its size
+# matters and the inode timestamp write done by a full fsync is wasted.
+_sync = getattr(os, 'fdatasync', os.fsync)
+
+# Piped SETs are buffered and handed to the log writer once BATCH_SIZE are
+# pending, on the next GET, at exit, or after at most FLUSH_INTERVAL seconds.
+# Interactive SETs are written (and synced per SYNC_POLICY) before "(OK)".
+BATCH_SIZE = 16
+FLUSH_INTERVAL = 1
+
+# Background log writer: at most LOG_QUEUE_SIZE batches may wait in the
+# queue (SETs block beyond that), and up to WRITER_MAX_BATCHES queued
+# batches are coalesced into one write + sync
+LOG_QUEUE_SIZE = 256
+WRITER_MAX_BATCHES = 16
+
+# The log is grown with posix_fallocate in PREALLOC_CHUNK steps so appends
+# land in already-allocated blocks; the unused tail is zero-filled and is
+# truncated away on clean shutdown
+PREALLOC_CHUNK = 4 * 1024 * 1024
+
+# Checkpoint (compact the log to one SET per live key) once the log holds
+# more than CHECKPOINT_RATIO records per live key, but not for tiny logs
+CHECKPOINT_RATIO = 4
+CHECKPOINT_MIN_RECORDS = 1024
+
+# In-memory key-value store (O(1) lookups), split into NSHARDS dicts picked
+# by hash(key) so each hash table stays small and cache-friendly.
+# NSHARDS must be a power of two.
+NSHARDS = 16
+_SHARD_MASK = NSHARDS - 1
+_shards = [{} for _ in range(NSHARDS)]
+
+# Append-only log descriptor, opened once at startup and reused by every SET
+_log_fd = None
+
+# Logical end of the log (offset of the next record; None until known) and
+# bytes allocated on disk, which may run past it after preallocation
+_log_end = None
+_log_capacity = 0
+
+# Cleared if posix_fallocate is unavailable or unsupported by the filesystem
+_prealloc = hasattr(os, 'posix_fallocate')
+
+# Encoded batches waiting for the writer thread
+_log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+
+# First error hit by the writer thread. Sticky: once set, the log is known
+# to be missing SETs the store already holds, so every later flush, drain
+# and GET raises it instead of serving data that is not on disk.
+_writer_error = None
+
+# Serialises background writes/syncs against the log swap in checkpoint()
+_log_lock = threading.Lock()
+
+# Number of SET records currently in the log (live + overwritten)
+_log_records = 0
+
+# Set by load_store() when the log must be rewritten before appending
+# (legacy text format, or a torn record at the tail)
+_needs_rewrite = False
+
+# Log size (in records) that allows the next ratio-triggered checkpoint;
+# doubled after a failed checkpoint so it is not retried on every batch
+_checkpoint_min = CHECKPOINT_MIN_RECORDS
+
+# Set by load_store() when the log could not be fully replayed; the store is
+# then incomplete, so the log must never be compacted from it
+_load_failed = False
+
+# True when the log was opened with O_DSYNC, so write() itself is durable
+_write_syncs = False
+
+# Set when the log has unsynced writes (used by the EVERY_SEC policy)
+_dirty = False
+
+# SETs accepted but not yet written, as (key, value) pairs
+_pending_keys = []
+
+# Guards _pending_keys/_wbuf/_wlen and the store update in flush_pending(),
+# which the background flush thread also calls
+_pending_lock = threading.Lock()
+
+# Reusable write buffer holding the encoded pending records in _wbuf[:_wlen].
+# Its length is kept between batches so steady-state SETs do not reallocate;
+# it is trimmed back to WBUF_SOFT_MAX after an unusually large batch.
+WBUF_SOFT_MAX = 128 * 1024
+_wbuf = bytearray(4096)
+_wlen = 0
+
+# True when attached to a terminal (prompts and "(OK)" acks go to stderr)
+interactive = False
+
+
+# ─────────────────────────────────────────────────────────────
+# Sharded Store Helpers
+# ─────────────────────────────────────────────────────────────
+def store_update(pairs):
+    """
+    Insert (key, value) pairs into their shards; later pairs win.
+    """
+    shards = _shards
+    mask = _SHARD_MASK
+    for key, value in pairs:
+        shards[hash(key) & mask][key] = value
+
+
+def store_len():
+    """
+    Number of live keys across all shards.
+    """
+    return sum(map(len, _shards))
+
+
+def store_items():
+    """
+    Iterate (key, value) over all shards.
+    """
+    for shard in _shards:
+        yield from shard.items()
 
 
 # ─────────────────────────────────────────────────────────────
@@ -19,51 +169,511 @@ store = {}
 def load_store():
     """
     Load the persistent log file into memory.
-    Only 'SET <key> <value>' lines are applied.
-    This replays history; last write wins.
+    Records are replayed in order; last write wins.
+
+    The whole file is pulled in with a single read() and binary records are
+    sliced out by their length prefixes, so no text scanning is needed.
+    Legacy text logs are still read and flagged for rewriting.
+    """
+    global _log_records, _needs_rewrite, _log_end, _load_failed
+    try:
+        try:
+            fd = os.open(DATA_FILE, os.O_RDONLY)
+        except FileNotFoundError:
+            return  # No previous data — nothing to load
+        try:
+            size = os.fstat(fd).st_size
+            data = _read_all(fd, size) if size else b''
+        finally:
+            os.close(fd)
+
+        if data.startswith(LOG_MAGIC):
+            records, end = _read_records(data, len(LOG_MAGIC), len(data))
+            if data.count(0, end) != len(data) - end:
+                if not _is_torn_tail(data, end):
+                    # Dropping the rest would lose valid records; refuse
+                    # to start instead of compacting them away
+                    raise OSError(f"corrupt record at offset {end}")
+                print("Warning: ignoring torn record at end of data file",
+                      file=sys.stderr)
+                _needs_rewrite = True
+            _log_end = end  # Anything after is torn or preallocated zeros
+        elif data.startswith(_MAGIC_FAMILY):
+            raise OSError(f"unsupported log format {data[:4]!r}")
+        else:
+            records = _read_text_records(data)
+            _needs_rewrite = bool(data)
+        store_update(records)  # Later keys win
+        _log_records = len(records)
+    except (IOError, OSError, UnicodeDecodeError) as e:
+        print(f"Error loading data file: {e}", file=sys.stderr)
+        _load_failed = True
+
+
+def _read_all(fd, size):
+    """
+    Read size bytes from fd, normally in one read() call.
+    Loops only if the OS returns a short read (e.g. files over 2 GiB).
+    """
+    data = os.read(fd, size)
+    while len(data) < size:
+        chunk = os.read(fd, size - len(data))
+        if not chunk:
+            break  # File shrank underneath us
+        data += chunk
+    return data
+
+
+def _read_records(buf, off, size):
+    """
+    Decode length-prefixed records from buf[off:size], stopping at a torn
+    or corrupt record (bad checksum) or at the zero-filled preallocated
+    tail (keys are never empty).
+    Returns (list of (key, value), offset just past the last whole record).
+    """
+    unpack = _REC_HEADER.unpack_from
+    header = _REC_HEADER.size
+    crc32 = zlib.crc32
+    records = []
+    while off + header <= size:
+        klen, vlen, crc = unpack(buf, off)
+        if not klen:
+            break  # Zero header — end of written data
+        start = off + header
+        mid = start + klen
+        end = mid + vlen
+        if end > size:
+            break  # Record was cut short (crash mid-write)
+        kb = buf[start:mid]
+        vb = buf[mid:end]
+        if crc32(vb, crc32(kb)) != crc:
+            break  # Torn or corrupt record
+        records.append((kb.decode(), vb.decode()))
+        off = end
+    return records, off
+
+
+def _is_torn_tail(buf, off):
+    """
+    Tell a record torn by a crash from corruption inside the log. A torn
+    record is the last thing written: every byte past the part of it that
+    made it to disk is zero (preallocated space) or beyond the end of file.
+    """
+    written = len(buf.rstrip(b'\0'))  # Offset just past the last non-zero byte
+    if off + _REC_HEADER.size > len(buf):
+        return True  # Header cut short by the end of file
+    klen, vlen, _ = _REC_HEADER.unpack_from(buf, off)
+    return klen != 0 and written <= off + _REC_HEADER.size + klen + vlen
+
+
+def _read_text_records(data):
+    """
+    Decode a legacy text log of 'SET <key> <value>' lines.
+    """
+    return [
+        (fields[1].decode(), fields[2].decode())
+        for fields in map(_parse_set, data.split(b'\n'))
+        if len(fields) == 3
+    ]
+
+
+def _encode_record(key, value):
+    """
+    Encode one SET as a length-prefixed log record.
     """
-    if not os.path.exists(DATA_FILE):
-        return  # No previous data — nothing to load
+    kb = key.encode()
+    vb = value.encode()
+    crc = zlib.crc32(vb, zlib.crc32(kb))
+    return _REC_HEADER.pack(len(kb), len(vb), crc) + kb + vb
 
+
+def _parse_set(line):
+    """
+    Split a raw b'SET <key> <value>' log line into [b'SET', key, value] the
+    way the original text loader did: surrounding whitespace is ignored and
+    fields are separated by runs of whitespace, so a key is never empty.
+    Non-SET or malformed lines yield fewer fields and are skipped.
+    """
+    line = line.strip()
+    if not line.startswith(_SET_PREFIX):
+        return ()
+    return line.split(None, 2)
+
+
+def open_log():
+    """
+    Open the append-only log once and keep it open for the process lifetime.
+    The handle is closed automatically on interpreter shutdown.
+    Starts the log writer thread and the periodic flush thread.
+    """
+    _open_log_file()
+    atexit.register(close_log)
+
+    # atexit is LIFO: drain pending SETs, then sync, then close
+    if SYNC_POLICY == SYNC_EVERY_SEC:
+        atexit.register(sync_log)
+    threading.Thread(target=_writer_loop, daemon=True).start()
+    threading.Thread(target=_flush_loop, daemon=True).start()
+    atexit.register(_drain_at_exit)
+
+
+def _open_log_file():
+    """
+    (Re)open DATA_FILE for writing at its logical end, so each write() goes
+    straight to the OS. O_APPEND is not used: preallocated space past the
+    logical end must be overwritten, not appended after.
+
+    With SYNC_POLICY ALWAYS the log is opened O_DSYNC where supported, so
+    each batch is persisted by its write() alone instead of write + sync.
+    """
+    global _log_fd, _write_syncs, _log_end, _log_capacity
+    flags = os.O_WRONLY | os.O_CREAT | getattr(os, 'O_BINARY', 0)
+    if SYNC_POLICY == SYNC_ALWAYS and hasattr(os, 'O_DSYNC'):
+        flags |= os.O_DSYNC
+        _write_syncs = True
+    _log_fd = os.open(DATA_FILE, flags, 0o644)
+
+    size = os.fstat(_log_fd).st_size
+    if size == 0:
+        os.write(_log_fd, LOG_MAGIC)  # Fresh log — stamp the format
+        _log_end = size = len(LOG_MAGIC)
+    elif _log_end is None:
+        _log_end = size  # Not replayed by load_store(); append at EOF
+    _log_capacity = size
+    os.lseek(_log_fd, _log_end, os.SEEK_SET)
+
+
+def _reserve(nbytes):
+    """
+    Make sure the next nbytes after the logical end are allocated on disk,
+    extending the file in PREALLOC_CHUNK steps. Preallocation is dropped
+    for good if the platform or filesystem does not support it.
+    """
+    global _log_capacity, _prealloc
+    need = _log_end + nbytes
+    if need <= _log_capacity or not _prealloc:
+        return
+    grow = -(-(need - _log_capacity) // PREALLOC_CHUNK) * PREALLOC_CHUNK
     try:
-        with open(DATA_FILE, 'r') as f:
-            for line in f:
-                line = line.strip()
-                if line.startswith(f"{CMD_SET} "):
-                    parts = line.split(None, 2)
-                    if len(parts) == 3:
-                        key, value = parts[1], parts[2]
-                        store[key] = value  # Overwrite if key exists
+        os.posix_fallocate(_log_fd, _log_capacity, grow)
+    except OSError:
+        _prealloc = False  # Fall back to plain growing appends
+        return
+    _log_capacity += grow
+
+
+def close_log():
+    """
+    Trim unused preallocated space (and any torn bytes from a failed write)
+    and close the log descriptor, if open.
+    """
+    global _log_fd
+    if _log_fd is None:
+        return
+    try:
+        if os.fstat(_log_fd).st_size > _log_end:
+            os.ftruncate(_log_fd, _log_end)
+    except OSError:
+        pass  # A zero tail is harmless; load_store() skips it
+    os.close(_log_fd)
+    _log_fd = None
+
+
+def sync_log():
+    """
+    fsync the log if there are writes since the last sync.
+    """
+    global _dirty
+    if not _dirty:
+        return
+    _dirty = False  # Clear first so a concurrent SET re-marks it dirty
+    try:
+        with _log_lock:
+            _sync(_log_fd)
     except (IOError, OSError) as e:
-        print(f"Error loading data file: {e}", file=sys.stderr)
+        print(f"Error syncing data file: {e}", file=sys.stderr)
+
+
+def _flush_loop():
+    """
+    Bound how long a SET can sit in memory: every FLUSH_INTERVAL seconds,
+    write out pending SETs and, under EVERY_SEC, group-commit everything
+    written in that interval with one fsync.
+    Stops once the log writer has failed; the CLI reports that error.
+    """
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        try:
+            drain_log()
+        except (IOError, OSError):
+            return  # Sticky writer error — nothing more can be persisted
+        if SYNC_POLICY == SYNC_EVERY_SEC:
+            sync_log()
 
 
 def save_set(key, value):
     """
-    Persist a SET operation to disk (append-only).
-    Updates in-memory store after writing to file.
+    Queue a SET operation for the append-only log.
+    The record is encoded into the shared write buffer; the batch is written
+    once BATCH_SIZE SETs are pending and the in-memory store is updated
+    when the batch is flushed.
+    """
+    global _wlen
+    kb = key.encode()
+    vb = value.encode()
+    with _pending_lock:
+        start = _wlen + _REC_HEADER.size
+        mid = start + len(kb)
+        end = mid + len(vb)
+        if end > len(_wbuf):
+            _wbuf.extend(bytes(end - len(_wbuf)))  # Grow only when needed
+
+        _REC_HEADER.pack_into(_wbuf, _wlen, len(kb), len(vb),
+                              zlib.crc32(vb, zlib.crc32(kb)))
+        _wbuf[start:mid] = kb
+        _wbuf[mid:end] = vb
+        _wlen = end
+
+        _pending_keys.append((key, value))
+        full = len(_pending_keys) >= BATCH_SIZE
+    if full:
+        flush_pending()
+
+
+def flush_pending():
+    """
+    Hand the buffered SETs to the log writer thread as one batch and apply
+    them to the in-memory store. Returns without waiting for the disk;
+    call drain_log() when the batch must be durable.
+    """
+    global _wlen, _log_records
+    _check_writer()
+    with _pending_lock:
+        if not _pending_keys:
+            return
 
-    Uses flush() and fsync() to ensure data is physically written.
+        with memoryview(_wbuf) as view:
+            batch = view[:_wlen].tobytes()
+        _log_queue.put(batch)  # Blocks only if the writer is far behind
+
+        store_update(_pending_keys)  # Update in-memory
+        _log_records += len(_pending_keys)
+
+        _pending_keys.clear()
+        _wlen = 0
+        if len(_wbuf) > WBUF_SOFT_MAX:
+            del _wbuf[WBUF_SOFT_MAX:]
+
+        maybe_checkpoint()
+
+
+def drain_log():
+    """
+    Flush pending SETs and wait until the writer thread has written (and,
+    per SYNC_POLICY, synced) everything queued so far.
+    """
+    flush_pending()
+    _log_queue.join()
+    _check_writer()
+
+
+def _drain_at_exit():
+    """
+    drain_log() for atexit; a writer error was already reported by the CLI.
     """
     try:
-        with open(DATA_FILE, 'a') as f:
-            f.write(f"{CMD_SET} {key} {value}\n")
-            f.flush()            # Write to OS buffer
-            os.fsync(f.fileno()) # Force write to disk
+        drain_log()
+    except (IOError, OSError):
+        pass
+
+
+def _check_writer():
+    """
+    Raise the error recorded by the writer thread, if any.
+    """
+    if _writer_error is not None:
+        raise _writer_error
+
+
+def _writer_loop():
+    """
+    Background log writer: takes queued batches, coalescing up to
+    WRITER_MAX_BATCHES of them into a single write() and (depending on
+    SYNC_POLICY) a single fsync(). Runs while the main thread parses the
+    next commands.
+    """
+    global _dirty, _log_end, _writer_error
+    while True:
+        batches = [_log_queue.get()]
+        while len(batches) < WRITER_MAX_BATCHES:
+            try:
+                batches.append(_log_queue.get_nowait())
+            except queue.Empty:
+                break
+
+        try:
+            if _writer_error is not None:
+                continue  # Drop batches after a failure: no gaps in the log
+            data = b''.join(batches)
+            with _log_lock:
+                fd = _log_fd
+                _reserve(len(data))
+                written = 0
+                try:
+                    with memoryview(data) as view:
+                        while written < len(data):  # Loop on a short write
+                            written += os.write(fd, view[written:])
+                except (IOError, OSError):
+                    # Rewind past the partial batch so _log_end and the fd
+                    # offset agree and close_log() trims only the torn bytes
+                    os.lseek(fd, _log_end, os.SEEK_SET)
+                    raise
+                _log_end += written
 
-        store[key] = value       # Update in-memory
+                if SYNC_POLICY == SYNC_ALWAYS:
+                    if not _write_syncs:
+                        _sync(fd)  # Force write to disk
+                else:
+                    _dirty = True
+        except (IOError, OSError) as e:
+            if _writer_error is None:
+                _writer_error = e  # Surfaced by flush_pending()/drain_log()
+        finally:
+            for _ in batches:
+                _log_queue.task_done()
+
+
+def maybe_checkpoint():
+    """
+    Run checkpoint() once overwritten records dominate the log, or when
+    load_store() found a log that must be rewritten. Never runs after a
+    failed load: the snapshot would drop every record that was not read.
+    """
+    if _load_failed:
+        return
+    if _needs_rewrite or (_log_records >= _checkpoint_min
+            and _log_records > CHECKPOINT_RATIO * store_len()):
+        checkpoint()
+
+
+def checkpoint():
+    """
+    Compact the log: write one SET per live key to a temporary file, sync it,
+    and atomically replace DATA_FILE with it. Startup replay then costs
+    O(live keys) instead of O(all SETs ever made).
+
+    Pending SETs must already be flushed (flush_pending() calls this after
+    updating the store). Queued batches are written to the old log first,
+    so none lands after the snapshot. An open log handle is reopened on the
+    new file. On failure the temporary file is removed and the next
+    ratio-triggered attempt waits until the log has doubled.
+    """
+    global _log_records, _dirty, _needs_rewrite, _log_end, _checkpoint_min
+    _log_queue.join()
+    tmp = DATA_FILE + '.tmp'
+    try:
+        with open(tmp, 'wb', buffering=64 * 1024) as f:
+            f.write(LOG_MAGIC)
+            f.writelines(_encode_record(k, v) for k, v in store_items())
+            f.flush()
+            _sync(f.fileno())
+            end = f.tell()
+
+        with _log_lock:
+            os.replace(tmp, DATA_FILE)
+            _log_end = end
+            if _log_fd is not None:
+                os.close(_log_fd)
+                _open_log_file()
+        _dirty = False  # The new file was synced above
+        _log_records = store_len()
+        _needs_rewrite = False
+        _checkpoint_min = CHECKPOINT_MIN_RECORDS
     except (IOError, OSError) as e:
-        print(f"Error writing to data file: {e}", file=sys.stderr)
+        print(f"Error writing checkpoint: {e}", file=sys.stderr)
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass  # Never created, or already renamed into place
+        _checkpoint_min = 2 * max(_log_records, _checkpoint_min)
+        return
+
+    try:
+        # Persist the rename itself (directory entry) where supported
+        dfd = os.open(os.path.dirname(os.path.abspath(DATA_FILE)), os.O_RDONLY)
+        try:
+            os.fsync(dfd)
+        finally:
+            os.close(dfd)
+    except OSError:
+        pass  # Not supported on this platform (e.g. Windows)
 
 
 def get_value(key):
     """
     Retrieve the value for a key from memory.
+    Pending SETs are flushed first so reads see earlier writes.
+    Raises the writer thread's error if the log has failed.
     Returns:
         - The stored string value if key exists
         - None if key does not exist (test expects empty output)
     """
-    return store.get(key)
+    if _pending_keys:  # Skip the call entirely when nothing is queued
+        flush_pending()
+    _check_writer()
+    return _shards[hash(key) & _SHARD_MASK].get(key)
+
+
+# ─────────────────────────────────────────────────────────────
+# Command Handlers
+# Each takes the raw bytes after the command word (surrounding whitespace
+# already stripped) and decodes only the fields it needs; returning True
+# stops the CLI loop.
+# ─────────────────────────────────────────────────────────────
+def _do_get(fields):
+    """GET <key>"""
+    if len(fields) != 2:
+        return  # Missing key or extra arguments
+    value = get_value(fields[1].decode())
+    if value is not None:
+        print(value)  # Key found → print value
+    else:
+        print("")     # Key not found → print empty (not "NULL")
+
+
+def _do_set(fields):
+    """SET <key> <value>"""
+    if len(fields) != 3:
+        return  # Missing key or value
+    _, key, value = fields
+    save_set(key.decode(), value.decode())
+    if interactive:
+        drain_log()  # A typed SET is on disk before it is acknowledged
+        print("(OK)", file=sys.stderr)
+
+
+def _do_exit(fields):
+    """EXIT"""
+    return len(fields) == 1  # Stop execution
+
+
+# Dispatch table: command word (as bytes) → handler
+_handlers = {
+    CMD_GET.encode(): _do_get,
+    CMD_SET.encode(): _do_set,
+    CMD_EXIT.encode(): _do_exit,
+}
+
+
+def _prompt_lines():
+    """
+    Yield encoded lines typed at the interactive prompt until Ctrl+D.
+    """
+    while True:
+        try:
+            yield input("db> ").encode()
+        except EOFError:
+            return
 
 
 # ─────────────────────────────────────────────────────────────
@@ -71,48 +681,52 @@ def get_value(key):
 # ─────────────────────────────────────────────────────────────
 if __name__ == '__main__':
     load_store()
+    maybe_checkpoint()  # Compact a bloated or legacy log before appending
+    if _load_failed or _needs_rewrite:
+        sys.exit(1)  # Serving or appending now could lose data; error above
+    open_log()
 
     # Detect interactive vs automated mode (e.g. piping input in tests)
     interactive = sys.stdin.isatty()
 
+    if not interactive:
+        # Batch/piped mode: block-buffer stdout so GET replies are written
+        # in 64 KiB chunks instead of one write() per line
+        sys.stdout = open(sys.stdout.fileno(), 'w', buffering=64 * 1024,
+                          closefd=False)
+
     if interactive:
         print("--- Simple Key-Value Store ---", file=sys.stderr)
         print("Commands: SET <key> <value>, GET <key>, EXIT", file=sys.stderr)
 
-    while True:
+    # Piped input is read as raw bytes straight from the buffer, skipping
+    # the text layer's per-line decode
+    lines = _prompt_lines() if interactive else sys.stdin.buffer
+    lookup = _handlers.get  # Hot-loop local
+
+    status = 0
+    try:
         try:
-            # Show prompt only in interactive mode
-            line = input("db> " if interactive else "")
-        except (EOFError, KeyboardInterrupt):
-            break  # Exit gracefully on Ctrl+D or Ctrl+C
-
-        if not line:
-            continue  # Ignore empty input
-
-        line = line.strip()
-
-        if line == CMD_EXIT:
-            break  # Stop execution
-
-        parts = line.split(None, 2)
-
-        # ──────────────────────────────────────────────
-        # GET <key>
-        # ──────────────────────────────────────────────
-        if len(parts) == 2 and parts[0] == CMD_GET:
-            value = get_value(parts[1])
-            if value is not None:
-                print(value)  # Key found → print value
-            else:
-                print("")     # Key not found → print empty (not "NULL")
-
-        # ──────────────────────────────────────────────
-        # SET <key> <value>
-        # ──────────────────────────────────────────────
-        elif len(parts) >= 3 and parts[0] == CMD_SET:
-            key, value = parts[1], parts[2]
-            save_set(key, value)
-            if interactive:
-                print("(OK)", file=sys.stderr)
-
-        # Ignore invalid/unknown commands silently to match expected behavior
+            for line in lines:
+                # Command word, key and value (which keeps its inner
+                # whitespace); surrounding whitespace is ignored
+                fields = line.strip().split(None, 2)
+                if not fields:
+                    continue  # Ignore empty input
+
+                # Ignore invalid/unknown commands silently to match
+                # expected behavior
+                handler = lookup(fields[0])
+                if handler and handler(fields):
+                    break  # Stop execution
+        except KeyboardInterrupt:
+            pass  # Exit gracefully on Ctrl+C
+        drain_log()  # Persist any SETs still queued or in flight
+    except (IOError, OSError) as e:
+        if e is not _writer_error:
+            raise
+        print(f"Error writing to data file: {e}", file=sys.stderr)
+        status = 1
+
+    sys.stdout.flush()  # Emit any buffered GET output before exiting
+    sys.exit(status)
@@ -0,0 +1,247 @@
+import os
+import signal
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+import zlib
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'kvstore.py')
+
+
+def encode_record(key, value):
+    """Build one binary log record the way kvstore writes it."""
+    kb, vb = key.encode(), value.encode()
+    crc = zlib.crc32(vb, zlib.crc32(kb))
+    return struct.pack('<III', len(kb), len(vb), crc) + kb + vb
+
+
+class KVStoreTestCase(unittest.TestCase):
+    """Runs kvstore.py as a piped subprocess inside a scratch directory."""
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.dir = self._tmp.name
+        self.db = os.path.join(self.dir, 'data.db')
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def run_kv(self, commands, **env):
+        return subprocess.run(
+            [sys.executable, SCRIPT], input=commands.encode(),
+            cwd=self.dir, capture_output=True, timeout=30,
+            env=dict(os.environ, **env),
+        )
+
+    def start_kv(self, max_file_size=None, **env):
+        """Start kvstore.py with a pipe for stdin, optionally capping the
+        size of files it may write (writes past the cap fail with EFBIG)."""
+        def limit_file_size():
+            signal.signal(signal.SIGXFSZ, signal.SIG_IGN)
+            resource.setrlimit(resource.RLIMIT_FSIZE,
+                               (max_file_size, max_file_size))
+
+        return subprocess.Popen(
+            [sys.executable, SCRIPT], stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=self.dir,
+            env=dict(os.environ, **env),
+            preexec_fn=limit_file_size if max_file_size else None,
+        )
+
+    def get(self, *keys):
+        """GET each key in a fresh process; returns the output lines."""
+        proc = self.run_kv(''.join(f"GET {k}\n" for k in keys))
+        self.assertEqual(proc.returncode, 0, proc.stderr)
+        return proc.stdout.decode().split('\n')[:-1]
+
+    def write_db(self, data):
+        with open(self.db, 'wb') as f:
+            f.write(data)
+
+    def read_db(self):
+        with open(self.db, 'rb') as f:
+            return f.read()
+
+
+class TestRecovery(KVStoreTestCase):
+
+    def test_legacy_text_log_is_migrated(self):
+        # Odd lines parse as the original text loader parsed them
+        self.write_db("SET a old\nSET a hello world\nSET b 2\n"
+                      "SET  c d\nSET e  f \r\n  SET g\th\tи\n"
+                      "SET\tx y\nSET z\nGET a\nSET x 1\n".encode())
+        expected = ['hello world', '2', 'd', 'f', 'h\tи', '1', '']
+        keys = ('a', 'b', 'c', 'e', 'g', 'x', 'z')
+        self.assertEqual(self.get(*keys), expected)
+
+        data = self.read_db()
+        self.assertTrue(data.startswith(b'KVB2'))
+        self.assertEqual(self.get(*keys), expected)
+
+    def test_torn_tail_is_dropped(self):
+        good = b'KVB2' + encode_record('a', '1')
+        self.write_db(good + encode_record('b', 'value')[:-2])
+
+        proc = self.run_kv("GET a\nGET b\nSET c 3\n")
+        self.assertEqual(proc.stdout, b"1\n\n")
+        self.assertIn(b"torn record", proc.stderr)
+        self.assertEqual(self.get('a', 'b', 'c'), ['1', '', '3'])
+
+    def test_torn_record_into_zero_tail_is_dropped(self):
+        # Header promises 3 + 5 bytes but only 2 made it before the crash;
+        # the rest reads back as preallocated zeros
+        torn = encode_record('abc', 'value')[:12 + 2]
+        self.write_db(b'KVB2' + encode_record('a', '1') + torn + bytes(4096))
+
+        self.run_kv("SET c 3\n")
+        self.assertEqual(self.get('a', 'c'), ['1', '3'])
+        self.assertNotIn(b'ab\x00', self.read_db())
+
+    def test_corrupt_record_mid_log_fails_load(self):
+        records = [encode_record(f"k{i}", f"v{i}") for i in range(1002)]
+        rec = bytearray(records[1])
+        rec[-1] ^= 1  # Flip one bit in the second record's value
+        records[1] = bytes(rec)
+        data = b'KVB2' + b''.join(records) + bytes(4096)
+        self.write_db(data)
+
+        proc = self.run_kv("GET k0\nSET a 1\n")
+        self.assertEqual(proc.returncode, 1)
+        self.assertIn(b"corrupt record", proc.stderr)
+        self.assertEqual(self.read_db(), data)
+
+    def test_zero_tail_after_crash(self):
+        good = b'KVB2' + encode_record('a', '1')
+        self.write_db(good + bytes(4096))
+
+        proc = self.run_kv("GET a\nSET b 2\n")
+        self.assertEqual(proc.stdout, b"1\n")
+        self.assertEqual(proc.stderr, b"")
+        # New records overwrite the zeros; clean shutdown trims the rest
+        self.assertEqual(self.read_db(), good + encode_record('b', '2'))
+        self.assertEqual(self.get('a', 'b'), ['1', '2'])
+
+    def test_failed_load_never_checkpoints(self):
+        bad = struct.pack('<III', 2, 1, zlib.crc32(b'\xff', zlib.crc32(b'zz')))
+        data = (b'KVB2'
+                + b''.join(encode_record(f"k{i}", f"v{i}") for i in range(100))
+                + bad + b'zz\xff')
+        self.write_db(data)
+
+        proc = self.run_kv(''.join(f"SET a {i}\n" for i in range(1100)))
+        self.assertNotEqual(proc.returncode, 0)
+        self.assertIn(b"Error loading data file", proc.stderr)
+        self.assertEqual(self.read_db(), data)
+
+    def test_checkpoint_keeps_live_keys(self):
+        self.run_kv(''.join(f"SET k{i % 10} v{i}\n" for i in range(3000)))
+        self.assertEqual(self.get('k0', 'k9'), ['v2990', 'v2999'])
+        history = sum(len(encode_record(f"k{i % 10}", f"v{i}"))
+                      for i in range(3000))
+        self.assertLess(len(self.read_db()), history // 2)
+
+    @unittest.skipUnless(os.path.exists('/dev/full'), "needs /dev/full")
+    def test_failed_checkpoint_is_cleaned_up_and_retried_later(self):
+        # Writes through the tmp path fail with ENOSPC
+        os.symlink('/dev/full', self.db + '.tmp')
+        proc = self.run_kv(''.join(f"SET k{i % 10} v{i}\n" for i in range(3000)))
+        self.assertEqual(proc.returncode, 0)
+        self.assertEqual(proc.stderr.count(b"Error writing checkpoint"), 1)
+        self.assertFalse(os.path.lexists(self.db + '.tmp'))
+        self.assertEqual(self.get('k0', 'k9'), ['v2990', 'v2999'])
+
+    def test_failed_checkpoint_backs_off(self):
+        os.mkdir(self.db + '.tmp')  # Checkpoint cannot create its tmp file
+        proc = self.run_kv(''.join(f"SET k{i % 10} v{i}\n" for i in range(3000)))
+        self.assertEqual(proc.returncode, 0)
+        # Tried at 1024 and 2048 records, not on every batch in between
+        self.assertEqual(proc.stderr.count(b"Error writing checkpoint"), 2)
+        self.assertEqual(self.get('k0', 'k9'), ['v2990', 'v2999'])
+
+
+class TestCLI(KVStoreTestCase):
+
+    def test_parsing_matches_baseline(self):
+        # Expected output recorded from the original line-based parser
+        script = (
+            "SET a 1\n"
+            "GET a \n"
+            " GET a\n"
+            "SET  b 2\n"
+            "GET\tb\n"
+            "SET\tc\t3  \n"
+            "GET c\n"
+            "GET a b\n"
+            "SET d\n"
+            "GET  \n"
+            "EXIT now\n"
+            "\n"
+            "   \n"
+            "SET e  x  y \n"
+            "GET e\n"
+            "GET missing\n"
+            " EXIT \n"
+            "GET a\n"
+        )
+        proc = self.run_kv(script)
+        self.assertEqual(proc.returncode, 0, proc.stderr)
+        self.assertEqual(proc.stdout, b"1\n1\n2\n3\nx  y\n\n")
+
+    def test_unknown_sync_policy_falls_back_to_always(self):
+        proc = self.run_kv("SET a 1\n", SYNC_POLICY='always_')
+        self.assertEqual(proc.returncode, 0)
+        self.assertIn(b"unknown SYNC_POLICY 'ALWAYS_', using ALWAYS",
+                      proc.stderr)
+        self.assertEqual(self.get('a'), ['1'])
+
+    def test_known_sync_policies_are_accepted(self):
+        for policy in ('always', 'EVERY_SEC', 'None'):
+            proc = self.run_kv(f"SET {policy} 1\n", SYNC_POLICY=policy)
+            self.assertEqual(proc.stderr, b"", policy)
+        self.assertEqual(self.get('always', 'EVERY_SEC', 'None'),
+                         ['1', '1', '1'])
+
+    def test_values_survive_restart(self):
+        self.run_kv("SET greeting hello world\nSET k é\nEXIT\n")
+        self.assertEqual(self.get('greeting', 'k'), ['hello world', 'é'])
+
+
+@unittest.skipIf(resource is None, "needs resource.RLIMIT_FSIZE")
+class TestWriterErrors(KVStoreTestCase):
+
+    def test_flush_thread_survives_write_failure(self):
+        proc = self.start_kv(max_file_size=10)
+        proc.stdin.write(b"SET a 1\n")
+        proc.stdin.flush()
+        time.sleep(2.5)  # Let the periodic flush hit the failing write
+        proc.stdin.write(b"SET b 2\n")
+        proc.stdin.close()
+        self.assertEqual(proc.wait(timeout=30), 1)
+        stderr = proc.stderr.read()
+        proc.stdout.close()
+        proc.stderr.close()
+        self.assertNotIn(b"Traceback", stderr)
+        self.assertIn(b"Error writing to data file", stderr)
+
+    def test_no_gap_after_failed_write(self):
+        # The first batch cannot fit under the cap, the later small ones could
+        commands = (''.join(f"SET big{i} {'x' * 8192}\n" for i in range(16))
+                    + ''.join(f"SET k{i} {i}\n" for i in range(640)))
+        proc = self.start_kv(max_file_size=65536)
+        proc.communicate(commands.encode(), timeout=30)
+        self.assertEqual(proc.returncode, 1)
+        # Whatever was persisted is a prefix of the accepted SETs
+        self.assertEqual(self.get('big0', 'k0', 'k639'), ['', '', ''])
+        self.assertEqual(self.read_db(), b'KVB2')
+
+
+if __name__ == '__main__':
+    unittest.main()